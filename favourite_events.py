@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Événement envoyé à un abonné trop lent avant la fermeture de son flux
+DROPPED_EVENT = {"type": "dropped", "message": "Flux interrompu (client trop lent), resynchronisation nécessaire"}
+
+class FavouriteSubscription:
+    """Abonnement d'une connexion SSE aux événements de favoris d'un utilisateur"""
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+class FavouriteEventBroker:
+    """
+    Diffusion en mémoire des ajouts/suppressions de favoris vers les connexions SSE
+    du processus : le flux suppose donc un seul worker. Chaque connexion dispose d'une
+    file bornée : un client qui ne consomme pas assez vite est déconnecté plutôt que
+    de faire grossir la mémoire.
+    """
+
+    def __init__(self, max_connections: int = 100, queue_size: int = 32):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[FavouriteSubscription]] = {}
+        self._connections = 0
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def has_capacity(self) -> bool:
+        """Indique si une nouvelle connexion peut être acceptée"""
+        return self._connections < self.max_connections
+
+    def subscribe(self, user_id: str) -> Optional[FavouriteSubscription]:
+        """Créer un abonnement (None si le nombre maximal de connexions est atteint)"""
+        if not self.has_capacity():
+            return None
+
+        subscription = FavouriteSubscription(user_id, self.queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        self._connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: FavouriteSubscription) -> None:
+        """Retirer un abonnement (sans effet s'il a déjà été retiré)"""
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if not subscriptions or subscription not in subscriptions:
+            return
+
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+        self._connections -= 1
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+        """Envoyer un événement à toutes les connexions d'un utilisateur"""
+        for subscription in list(self._subscriptions.get(user_id, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: FavouriteSubscription) -> None:
+        """Déconnecter un abonné lent : vider sa file et lui signaler l'interruption"""
+        logger.warning(f"🐢 Abonné SSE trop lent déconnecté (utilisateur {subscription.user_id})")
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(DROPPED_EVENT)
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Formater un événement au format text/event-stream"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
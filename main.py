@@ -1,8 +1,10 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import uvicorn
+import asyncio
 import os
 import logging
 
@@ -10,6 +12,9 @@ import logging
 from supabase_auth_service import SupabaseAuthService
 from supabase_favourites_service import SupabaseFavouritesService
 from supabase_auth_middleware import get_current_user
+from request_timing import ServerTimingMiddleware, TimedJSONResponse
+from musee_store import MuseeStore
+from favourite_events import FavouriteEventBroker, DROPPED_EVENT, format_sse
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -66,7 +71,8 @@ def get_cors_origins() -> List[str]:
 app = FastAPI(
     title="MuseoFile API",
     description="API pour la gestion des musées et favoris avec Supabase",
-    version="2.1.0"
+    version="2.1.0",
+    default_response_class=TimedJSONResponse
 )
 
 # Configuration CORS dynamique
@@ -78,11 +84,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+
+# Mesure des temps de réponse (en-tête Server-Timing + log des requêtes lentes)
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "500"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+app.add_middleware(
+    ServerTimingMiddleware,
+    slow_request_threshold_ms=SLOW_REQUEST_THRESHOLD_MS,
+    profile_sample_rate=PROFILE_SAMPLE_RATE,
 )
 
 # Instances des services
 auth_service = SupabaseAuthService()
-favourites_service = SupabaseFavouritesService()
+musee_store = MuseeStore(
+    max_entries=int(os.getenv("MUSEE_STORE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("MUSEE_STORE_TTL_SECONDS", "300"))
+)
+event_broker = FavouriteEventBroker(
+    max_connections=int(os.getenv("SSE_MAX_CONNECTIONS", "100")),
+    queue_size=int(os.getenv("SSE_QUEUE_SIZE", "32"))
+)
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+favourites_service = SupabaseFavouritesService(musee_store=musee_store, event_broker=event_broker)
 
 # Modèles Pydantic
 class UserRegister(BaseModel):
@@ -95,6 +121,9 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class FavouriteCreate(BaseModel):
     musee_id: str
     musee_data: Dict[str, Any]
@@ -104,6 +133,22 @@ class FavouriteResponse(BaseModel):
     date_ajout: str
     musee: Dict[str, Any]
 
+def session_tokens(session) -> Dict[str, Any]:
+    """Extrait les informations de token d'une session Supabase pour la réponse client"""
+    if not session:
+        return {
+            "access_token": None,
+            "refresh_token": None,
+            "expires_in": None,
+            "expires_at": None
+        }
+    return {
+        "access_token": session.access_token,
+        "refresh_token": session.refresh_token,
+        "expires_in": session.expires_in,
+        "expires_at": session.expires_at
+    }
+
 # Routes de santé
 @app.get("/")
 async def root():
@@ -145,7 +190,20 @@ async def login(user_data: UserLogin):
         return {
             "message": "Connexion réussie",
             "user": result["user"],
-            "access_token": result["session"].access_token if result["session"] else None
+            **session_tokens(result["session"])
+        }
+    else:
+        raise HTTPException(status_code=401, detail=result["error"])
+
+@app.post("/token/refresh")
+async def refresh_token(token_data: TokenRefresh):
+    """Renouveler le token d'accès à partir du refresh token"""
+    result = await auth_service.refresh_session(token_data.refresh_token)
+    
+    if result["success"]:
+        return {
+            "message": "Session renouvelée",
+            **session_tokens(result["session"])
         }
     else:
         raise HTTPException(status_code=401, detail=result["error"])
@@ -200,8 +258,29 @@ async def remove_favourite(
         raise HTTPException(status_code=404, detail=result["error"])
 
 @app.get("/favourites")
-async def get_favourites(current_user: dict = Depends(get_current_user)):
-    """Récupérer tous les favoris de l'utilisateur"""
+async def get_favourites(
+    shape: str = "embedded",
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Récupérer tous les favoris de l'utilisateur.
+    Avec shape=normalized, les favoris sont compacts et les musées renvoyés une seule fois dans un dictionnaire.
+    """
+    if shape not in ("embedded", "normalized"):
+        raise HTTPException(status_code=400, detail="Paramètre shape invalide (embedded ou normalized)")
+    
+    if shape == "normalized":
+        result = await favourites_service.get_user_favourites_normalized(current_user["id"])
+        
+        if result["success"]:
+            return {
+                "favourites": result["favourites"],
+                "musees": result["musees"],
+                "count": len(result["favourites"])
+            }
+        else:
+            raise HTTPException(status_code=500, detail=result["error"])
+    
     result = await favourites_service.get_user_favourites(current_user["id"])
     
     if result["success"]:
@@ -212,6 +291,65 @@ async def get_favourites(current_user: dict = Depends(get_current_user)):
     else:
         raise HTTPException(status_code=500, detail=result["error"])
 
+@app.get("/favourites/changes")
+async def get_favourite_changes(
+    since: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Récupérer les favoris ajoutés et supprimés depuis le dernier jeton de synchronisation"""
+    result = await favourites_service.get_favourite_changes(
+        user_id=current_user["id"],
+        since=since
+    )
+    
+    if result["success"]:
+        return {
+            "added": result["added"],
+            "removed": result["removed"],
+            "next_token": result["next_token"]
+        }
+    else:
+        status_code = 400 if result.get("invalid_token") else 500
+        raise HTTPException(status_code=status_code, detail=result["error"])
+
+@app.get("/favourites/stream")
+async def stream_favourites(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """Flux SSE des ajouts et suppressions de favoris de l'utilisateur"""
+    if not event_broker.has_capacity():
+        raise HTTPException(status_code=503, detail="Nombre maximal de connexions temps réel atteint")
+    
+    async def event_stream():
+        # Abonnement créé dans le générateur : il n'existe que si le flux démarre réellement
+        subscription = event_broker.subscribe(current_user["id"])
+        if subscription is None:
+            # Capacité atteinte entre la vérification et le démarrage du flux
+            yield format_sse({"type": "unavailable", "message": "Nombre maximal de connexions temps réel atteint"})
+            return
+        
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE pour garder la connexion ouverte
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                yield format_sse(event)
+                if event is DROPPED_EVENT:
+                    break
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/favourites/{musee_id}/check")
 async def check_favourite(
     musee_id: str,
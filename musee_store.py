@@ -0,0 +1,124 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Colonnes de la table musees renvoyées au client
+MUSEE_FIELDS = (
+    "identifiant",
+    "nom_officiel",
+    "adresse",
+    "lieu",
+    "code_postal",
+    "ville",
+    "region",
+    "departement",
+    "telephone",
+    "url",
+    "categorie",
+    "domaine_thematique",
+    "themes",
+    "histoire",
+    "atout",
+    "artiste",
+    "personnage_phare",
+    "interet",
+    "protection_batiment",
+    "protection_espace",
+    "refmer",
+    "annee_creation",
+    "date_de_mise_a_jour",
+    "coordonnees",
+)
+
+# Champs à faible cardinalité partagés entre musées (internés)
+INTERNED_FIELDS = frozenset({"code_postal", "ville", "region", "departement", "categorie", "domaine_thematique"})
+
+def deep_sizeof(value: Any) -> int:
+    """Taille mémoire approximative d'une valeur JSON (dict, liste, scalaires)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+class MuseeRecord:
+    """Enregistrement compact d'un musée (un slot par colonne, sans __dict__)"""
+
+    __slots__ = MUSEE_FIELDS + ("loaded_at", "size")
+
+    def __init__(self, row: Dict[str, Any], loaded_at: float):
+        for field in MUSEE_FIELDS:
+            value = row.get(field)
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, field, value)
+        self.loaded_at = loaded_at
+        # Taille calculée une seule fois : l'enregistrement n'est jamais modifié.
+        # Les champs internés sont partagés entre musées et ne sont pas comptés par entrée.
+        self.size = sys.getsizeof(self) + sum(
+            deep_sizeof(getattr(self, field)) for field in MUSEE_FIELDS if field not in INTERNED_FIELDS
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Représentation JSON du musée"""
+        return {field: getattr(self, field) for field in MUSEE_FIELDS}
+
+class MuseeStore:
+    """
+    Stockage en mémoire partagé des musées : chaque musée n'est conservé
+    qu'une seule fois, quel que soit le nombre d'utilisateurs qui l'ont en favori.
+    Les entrées expirent après ttl_seconds (pour refléter les mises à jour de la table
+    musees) et les moins récemment utilisées sont évincées au-delà de max_entries.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._records: "OrderedDict[str, MuseeRecord]" = OrderedDict()
+        self._total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def total_bytes(self) -> int:
+        """Mémoire approximative occupée par l'ensemble des entrées"""
+        return self._total_bytes
+
+    def get(self, musee_id: str) -> Optional[MuseeRecord]:
+        """Récupérer un musée du stockage (None s'il est absent ou expiré)"""
+        record = self._records.get(musee_id)
+        if record is None:
+            return None
+        if time.monotonic() - record.loaded_at >= self.ttl_seconds:
+            self._remove(musee_id)
+            return None
+        self._records.move_to_end(musee_id)
+        return record
+
+    def put(self, row: Dict[str, Any]) -> MuseeRecord:
+        """Ajouter ou remplacer un musée à partir d'une ligne de la table musees"""
+        record = MuseeRecord(row, loaded_at=time.monotonic())
+        self._remove(record.identifiant)
+        self._records[record.identifiant] = record
+        self._total_bytes += record.size
+        while len(self._records) > self.max_entries:
+            _, evicted = self._records.popitem(last=False)
+            self._total_bytes -= evicted.size
+        return record
+
+    def _remove(self, musee_id: str) -> None:
+        record = self._records.pop(musee_id, None)
+        if record is not None:
+            self._total_bytes -= record.size
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Mémoire occupée par entrée et au total (hors chaînes internées partagées)"""
+        return {
+            "entries": len(self._records),
+            "max_entries": self.max_entries,
+            "total_bytes": self._total_bytes,
+            "per_entry_bytes": {musee_id: record.size for musee_id, record in self._records.items()}
+        }
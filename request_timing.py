@@ -0,0 +1,164 @@
+import cProfile
+import contextvars
+import io
+import json
+import logging
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Mesures (phase, durée en ms) de la requête en cours ; None hors requête instrumentée
+_current_timings: "contextvars.ContextVar[Optional[List[Tuple[str, float]]]]" = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Mesure la durée d'un bloc et l'attache à la requête en cours.
+    Sans requête instrumentée (scripts, tests), le bloc s'exécute sans mesure.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((phase, (time.perf_counter() - start) * 1000))
+
+def aggregate_timings(timings: List[Tuple[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Regroupe les mesures par phase (durée cumulée et nombre d'appels), dans l'ordre d'apparition"""
+    phases: Dict[str, Dict[str, float]] = {}
+    for phase, duration in timings:
+        entry = phases.setdefault(phase, {"dur": 0.0, "count": 0})
+        entry["dur"] += duration
+        entry["count"] += 1
+    return phases
+
+def format_server_timing(phases: Dict[str, Dict[str, float]], total_ms: float) -> str:
+    """Construit la valeur de l'en-tête Server-Timing"""
+    metrics = []
+    for phase, entry in phases.items():
+        metric = f"{phase};dur={entry['dur']:.1f}"
+        if entry["count"] > 1:
+            metric += f';desc="{entry["count"]} appels"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+class TimedJSONResponse(JSONResponse):
+    """Réponse JSON dont le rendu est mesuré dans la phase 'serialization'"""
+
+    def render(self, content) -> bytes:
+        with timed("serialization"):
+            return super().render(content)
+
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    """
+    Middleware qui mesure les phases de chaque requête (vérification du token,
+    profil, appels Supabase, sérialisation), les expose dans l'en-tête
+    Server-Timing et journalise les requêtes lentes.
+
+    Si profile_sample_rate > 0, une fraction des requêtes est exécutée sous
+    cProfile et le profil est joint au log lorsque la requête est lente. Le
+    profileur observe tout le thread de la boucle d'événements : il n'est démarré
+    que si aucune autre requête n'est en cours, mais les requêtes arrivées pendant
+    la mesure figurent aussi dans le profil.
+    """
+
+    # cProfile ne supporte qu'un profileur actif à la fois par processus
+    _profiling_active = False
+    # Requêtes en cours de traitement dans le processus
+    _in_flight = 0
+
+    def __init__(self, app, slow_request_threshold_ms: float = 500.0,
+                 profile_sample_rate: float = 0.0, profile_top_n: int = 25):
+        super().__init__(app)
+        self.slow_request_threshold_ms = slow_request_threshold_ms
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_top_n = profile_top_n
+
+    async def dispatch(self, request: Request, call_next):
+        timings: List[Tuple[str, float]] = []
+        token = _current_timings.set(timings)
+        profiler = self._start_profiler()
+        ServerTimingMiddleware._in_flight += 1
+        max_in_flight = ServerTimingMiddleware._in_flight
+        start = time.perf_counter()
+
+        try:
+            response = await call_next(request)
+            max_in_flight = max(max_in_flight, ServerTimingMiddleware._in_flight)
+        finally:
+            ServerTimingMiddleware._in_flight -= 1
+            total_ms = (time.perf_counter() - start) * 1000
+            if profiler:
+                profiler.disable()
+                ServerTimingMiddleware._profiling_active = False
+            _current_timings.reset(token)
+
+        phases = aggregate_timings(timings)
+        response.headers["Server-Timing"] = format_server_timing(phases, total_ms)
+
+        if total_ms >= self.slow_request_threshold_ms:
+            self._log_slow_request(request, response.status_code, total_ms, phases, profiler, max_in_flight)
+
+        return response
+
+    def _start_profiler(self) -> Optional[cProfile.Profile]:
+        """Démarre cProfile pour cette requête si elle est échantillonnée"""
+        if self.profile_sample_rate <= 0 or ServerTimingMiddleware._profiling_active:
+            return None
+        # Le profil couvrirait aussi les requêtes déjà en cours
+        if ServerTimingMiddleware._in_flight > 0:
+            return None
+        if random.random() >= self.profile_sample_rate:
+            return None
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Un autre outil de profilage est déjà actif
+            return None
+        ServerTimingMiddleware._profiling_active = True
+        return profiler
+
+    def _log_slow_request(self, request: Request, status_code: int, total_ms: float,
+                          phases: Dict[str, Dict[str, float]],
+                          profiler: Optional[cProfile.Profile], max_in_flight: int) -> None:
+        """Écrit une ligne de log structurée (JSON) pour une requête lente"""
+        record = {
+            "event": "slow_request",
+            "method": request.method,
+            "path": request.url.path,
+            "status": status_code,
+            "duration_ms": round(total_ms, 1),
+            "threshold_ms": self.slow_request_threshold_ms,
+            "phases": {
+                phase: {"dur_ms": round(entry["dur"], 1), "count": entry["count"]}
+                for phase, entry in phases.items()
+            }
+        }
+        logger.warning(json.dumps(record, ensure_ascii=False))
+
+        if profiler:
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.profile_top_n)
+            logger.warning(
+                f"🐢 Profil cProfile du processus pendant {request.method} {request.url.path} "
+                f"({max_in_flight} requête(s) en cours au maximum, toutes incluses dans le profil):\n"
+                f"{stream.getvalue()}"
+            )
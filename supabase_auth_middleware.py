@@ -2,6 +2,7 @@ from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 from supabase_auth_service import SupabaseAuthService
+from request_timing import timed
 
 # Instance du service d'authentification
 auth_service = SupabaseAuthService()
@@ -17,7 +18,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         token = credentials.credentials
         
         # Vérifier le token avec Supabase
-        verification_result = await auth_service.verify_token(token)
+        with timed("auth_verify"):
+            verification_result = await auth_service.verify_token(token)
         
         if not verification_result["success"]:
             raise HTTPException(
@@ -27,7 +29,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             )
         
         # Récupérer le profil complet de l'utilisateur
-        profile_result = await auth_service.get_user_profile(verification_result["user_id"])
+        with timed("profile"):
+            profile_result = await auth_service.get_user_profile(verification_result["user_id"])
         
         if not profile_result["success"]:
             raise HTTPException(
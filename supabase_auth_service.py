@@ -1,5 +1,6 @@
 from typing import Dict, Any
 from supabase_config import supabase_config
+from request_timing import timed
 from supabase import Client
 
 class SupabaseAuthService:
@@ -11,10 +12,11 @@ class SupabaseAuthService:
         """Inscrire un nouvel utilisateur"""
         try:
             # Inscription avec Supabase Auth
-            auth_response = self.client.auth.sign_up({
-                "email": email,
-                "password": password
-            })
+            with timed("supabase_auth_sign_up"):
+                auth_response = self.client.auth.sign_up({
+                    "email": email,
+                    "password": password
+                })
             
             if auth_response.user:
                 # Créer le profil utilisateur dans la table users
@@ -26,7 +28,8 @@ class SupabaseAuthService:
                 }
                 
                 # Utiliser le service client pour insérer dans la table users
-                result = self.service_client.table('users').insert(user_data).execute()
+                with timed("supabase_users_insert"):
+                    result = self.service_client.table('users').insert(user_data).execute()
                 
                 return {
                     "success": True,
@@ -53,14 +56,16 @@ class SupabaseAuthService:
     async def login_user(self, email: str, password: str) -> Dict[str, Any]:
         """Connecter un utilisateur"""
         try:
-            auth_response = self.client.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
+            with timed("supabase_auth_sign_in"):
+                auth_response = self.client.auth.sign_in_with_password({
+                    "email": email,
+                    "password": password
+                })
             
             if auth_response.user and auth_response.session:
                 # Récupérer les données utilisateur
-                user_result = self.service_client.table('users').select('*').eq('id', auth_response.user.id).execute()
+                with timed("supabase_users_select"):
+                    user_result = self.service_client.table('users').select('*').eq('id', auth_response.user.id).execute()
                 
                 if user_result.data:
                     user_data = user_result.data[0]
@@ -86,6 +91,31 @@ class SupabaseAuthService:
                 "error": f"Erreur de connexion: {str(e)}"
             }
     
+    async def refresh_session(self, refresh_token: str) -> Dict[str, Any]:
+        """Renouveler une session à partir d'un refresh token (sans nouveau mot de passe)"""
+        try:
+            # Client dédié : la session renouvelée ne doit pas rester dans l'état partagé du serveur
+            refresh_client = supabase_config.get_stateless_client()
+            with timed("supabase_auth_refresh"):
+                auth_response = refresh_client.auth.refresh_session(refresh_token)
+
+            if auth_response.session:
+                return {
+                    "success": True,
+                    "session": auth_response.session
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": "Refresh token invalide"
+                }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Erreur de renouvellement de session: {str(e)}"
+            }
+
     async def logout_user(self, access_token: str) -> Dict[str, Any]:
         """Déconnecter un utilisateur"""
         try:
@@ -93,7 +123,8 @@ class SupabaseAuthService:
             self.client.auth.set_session(access_token, "")
             
             # Déconnexion
-            self.client.auth.sign_out()
+            with timed("supabase_auth_sign_out"):
+                self.client.auth.sign_out()
             
             return {
                 "success": True,
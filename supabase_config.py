@@ -1,5 +1,6 @@
 import os
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -21,6 +22,14 @@ class SupabaseConfig:
     def get_service_client(self) -> Client:
         """Retourne le client Supabase avec la clé service role (pour les opérations admin)"""
         return create_client(self.url, self.service_role_key)
+    
+    def get_stateless_client(self) -> Client:
+        """
+        Retourne un client Supabase (clé anonyme) qui ne conserve ni ne renouvelle
+        de session : à utiliser pour les opérations portant sur la session d'un utilisateur
+        """
+        options = SyncClientOptions(auto_refresh_token=False, persist_session=False)
+        return create_client(self.url, self.anon_key, options=options)
 
 # Instance globale de configuration
 supabase_config = SupabaseConfig()
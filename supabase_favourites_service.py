@@ -1,17 +1,68 @@
 from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+import base64
+import binascii
+import re
+import logging
 from supabase_config import supabase_config
+from request_timing import timed
+from musee_store import MuseeStore, MUSEE_FIELDS
+from favourite_events import FavouriteEventBroker
 from supabase import Client
 
+logger = logging.getLogger(__name__)
+
+# Champs sélectionnés pour un favori avec les données complètes du musée
+FAVOURITE_WITH_MUSEE_FIELDS = f"id, date_ajout, musees ({', '.join(MUSEE_FIELDS)})"
+
+# Marge retranchée aux jetons de synchronisation : date_ajout et date_suppression valent NOW(),
+# c'est-à-dire le début de la transaction et non sa validation, et l'horloge du serveur peut
+# différer de celle de la base. Les changements de cette fenêtre peuvent être renvoyés deux fois.
+SYNC_TOKEN_CLOCK_MARGIN = timedelta(seconds=5)
+
+# Durée de conservation des suppressions dans favourites_tombstones (voir la purge dans le README)
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+def parse_timestamp(value: str) -> datetime:
+    """Convertit un horodatage Supabase (ISO 8601, précision variable) en datetime UTC"""
+    value = value.replace("Z", "+00:00")
+    # Normaliser les fractions de seconde sur 6 chiffres pour fromisoformat
+    value = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), value, count=1)
+    parsed = datetime.fromisoformat(value)
+    # Les colonnes TIMESTAMP (sans fuseau) sont en UTC côté Supabase
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def encode_sync_token(timestamp: str) -> str:
+    """Encode un horodatage en jeton de synchronisation opaque"""
+    return base64.urlsafe_b64encode(timestamp.encode("utf-8")).decode("ascii")
+
+def decode_sync_token(token: str) -> str:
+    """Décode un jeton de synchronisation (lève ValueError si le jeton est invalide)"""
+    try:
+        timestamp = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        parse_timestamp(timestamp)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Jeton de synchronisation invalide")
+    return timestamp
+
 class SupabaseFavouritesService:
-    def __init__(self):
+    def __init__(self, musee_store: Optional[MuseeStore] = None,
+                 event_broker: Optional[FavouriteEventBroker] = None):
         self.client: Client = supabase_config.get_client()
         self.service_client: Client = supabase_config.get_service_client()
+        # Musées partagés entre utilisateurs pour les réponses normalisées
+        self.musee_store = musee_store if musee_store is not None else MuseeStore()
+        # Diffusion des ajouts/suppressions vers les flux SSE
+        self.event_broker = event_broker if event_broker is not None else FavouriteEventBroker()
     
     async def add_favourite(self, user_id: str, musee_id: str, musee_data: Dict[str, Any]) -> Dict[str, Any]:
         """Ajouter un musée aux favoris d'un utilisateur"""
         try:
             # Vérifier si le musée existe déjà dans la table musees
-            musee_result = self.service_client.table('musees').select('identifiant').eq('identifiant', musee_id).execute()
+            with timed("supabase_musees_select"):
+                musee_result = self.service_client.table('musees').select('identifiant').eq('identifiant', musee_id).execute()
             
             if not musee_result.data:
                 # Le musée n'existe pas, l'ajouter à la table musees
@@ -19,7 +70,8 @@ class SupabaseFavouritesService:
                     "identifiant": musee_id,
                     **musee_data
                 }
-                self.service_client.table('musees').insert(musee_to_insert).execute()
+                with timed("supabase_musees_insert"):
+                    self.service_client.table('musees').insert(musee_to_insert).execute()
             
             # Ajouter le favori
             favourite_data = {
@@ -27,9 +79,16 @@ class SupabaseFavouritesService:
                 "musee_id": musee_id
             }
             
-            result = self.service_client.table('favourites').insert(favourite_data).execute()
+            with timed("supabase_favourites_insert"):
+                result = self.service_client.table('favourites').insert(favourite_data).execute()
             
             if result.data:
+                self.event_broker.publish(user_id, {
+                    "type": "favourite_added",
+                    "musee_id": musee_id,
+                    "favourite": result.data[0]
+                })
+                
                 return {
                     "success": True,
                     "message": "Musée ajouté aux favoris",
@@ -55,9 +114,17 @@ class SupabaseFavouritesService:
     async def remove_favourite(self, user_id: str, musee_id: str) -> Dict[str, Any]:
         """Retirer un musée des favoris d'un utilisateur"""
         try:
-            result = self.service_client.table('favourites').delete().eq('user_id', user_id).eq('musee_id', musee_id).execute()
+            with timed("supabase_favourites_delete"):
+                result = self.service_client.table('favourites').delete().eq('user_id', user_id).eq('musee_id', musee_id).execute()
             
+            # La table favourites_tombstones est alimentée par un trigger AFTER DELETE (voir README)
             if result.data:
+                self.event_broker.publish(user_id, {
+                    "type": "favourite_removed",
+                    "musee_id": musee_id,
+                    "favourite_ids": [favourite["id"] for favourite in result.data]
+                })
+                
                 return {
                     "success": True,
                     "message": "Musée retiré des favoris"
@@ -77,38 +144,10 @@ class SupabaseFavouritesService:
     async def get_user_favourites(self, user_id: str) -> Dict[str, Any]:
         """Récupérer tous les favoris d'un utilisateur avec les données des musées"""
         try:
-            result = self.service_client.table('favourites').select(
-                """
-                id,
-                date_ajout,
-                musees (
-                    identifiant,
-                    nom_officiel,
-                    adresse,
-                    lieu,
-                    code_postal,
-                    ville,
-                    region,
-                    departement,
-                    telephone,
-                    url,
-                    categorie,
-                    domaine_thematique,
-                    themes,
-                    histoire,
-                    atout,
-                    artiste,
-                    personnage_phare,
-                    interet,
-                    protection_batiment,
-                    protection_espace,
-                    refmer,
-                    annee_creation,
-                    date_de_mise_a_jour,
-                    coordonnees
-                )
-                """
-            ).eq('user_id', user_id).execute()
+            with timed("supabase_favourites_select"):
+                result = self.service_client.table('favourites').select(
+                    FAVOURITE_WITH_MUSEE_FIELDS
+                ).eq('user_id', user_id).execute()
             
             if result.data:
                 return {
@@ -127,10 +166,126 @@ class SupabaseFavouritesService:
                 "error": f"Erreur lors de la récupération des favoris: {str(e)}"
             }
     
+    async def get_user_favourites_normalized(self, user_id: str) -> Dict[str, Any]:
+        """
+        Récupérer les favoris d'un utilisateur sous forme compacte (id, musee_id, date_ajout)
+        avec un dictionnaire des musées référencés, chaque musée n'étant transmis qu'une fois
+        """
+        try:
+            with timed("supabase_favourites_select"):
+                result = self.service_client.table('favourites').select(
+                    'id, musee_id, date_ajout'
+                ).eq('user_id', user_id).execute()
+            favourites = result.data or []
+            
+            # Musées déjà présents dans le stockage partagé
+            musee_ids = list(dict.fromkeys(favourite["musee_id"] for favourite in favourites))
+            records = {}
+            for musee_id in musee_ids:
+                record = self.musee_store.get(musee_id)
+                if record is not None:
+                    records[musee_id] = record
+            
+            # Charger uniquement les musées manquants
+            missing = [musee_id for musee_id in musee_ids if musee_id not in records]
+            if missing:
+                with timed("supabase_musees_select"):
+                    musees_result = self.service_client.table('musees').select(
+                        ', '.join(MUSEE_FIELDS)
+                    ).in_('identifiant', missing).execute()
+                for row in musees_result.data or []:
+                    records[row["identifiant"]] = self.musee_store.put(row)
+                logger.info(
+                    f"🏛️ Stockage des musées: {len(self.musee_store)} entrées, "
+                    f"{self.musee_store.total_bytes} octets"
+                )
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"🏛️ Mémoire par musée: {self.musee_store.memory_report()['per_entry_bytes']}")
+            
+            return {
+                "success": True,
+                "favourites": favourites,
+                "musees": {musee_id: record.to_dict() for musee_id, record in records.items()}
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Erreur lors de la récupération des favoris: {str(e)}"
+            }
+    
+    async def get_favourite_changes(self, user_id: str, since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Récupérer les favoris ajoutés et supprimés depuis un jeton de synchronisation.
+        Sans jeton, tous les favoris sont renvoyés comme ajouts (synchronisation initiale).
+        Les suppressions sont identifiées par favourite_id : un musée retiré puis ré-ajouté
+        apparaît dans les deux listes avec des identifiants de favori différents.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            since_timestamp = decode_sync_token(since) if since else None
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "invalid_token": True
+            }
+        
+        # Les suppressions plus anciennes que la rétention ont pu être purgées
+        if since_timestamp and parse_timestamp(since_timestamp) < now - TOMBSTONE_RETENTION:
+            return {
+                "success": False,
+                "error": "Jeton de synchronisation expiré, une synchronisation complète est nécessaire",
+                "invalid_token": True
+            }
+        
+        try:
+            lower_bound = None
+            if since_timestamp:
+                lower_bound = (parse_timestamp(since_timestamp) - SYNC_TOKEN_CLOCK_MARGIN).isoformat()
+            
+            query = self.service_client.table('favourites').select(
+                FAVOURITE_WITH_MUSEE_FIELDS
+            ).eq('user_id', user_id)
+            if lower_bound:
+                query = query.gt('date_ajout', lower_bound)
+            with timed("supabase_favourites_select"):
+                added_result = query.execute()
+            added = added_result.data or []
+            
+            removed = []
+            if lower_bound:
+                with timed("supabase_favourites_tombstones_select"):
+                    removed_result = self.service_client.table('favourites_tombstones').select(
+                        'favourite_id, musee_id, date_suppression'
+                    ).eq('user_id', user_id).gt('date_suppression', lower_bound).execute()
+                removed = removed_result.data or []
+            
+            # Le nouveau jeton correspond au dernier changement observé, et avance au moins
+            # jusqu'à l'horloge du serveur pour ne pas expirer chez un client sans changement
+            timestamps = [favourite["date_ajout"] for favourite in added]
+            timestamps += [tombstone["date_suppression"] for tombstone in removed]
+            timestamps.append((now - SYNC_TOKEN_CLOCK_MARGIN).isoformat())
+            next_token = encode_sync_token(max(timestamps, key=parse_timestamp))
+            
+            return {
+                "success": True,
+                "added": added,
+                "removed": removed,
+                "next_token": next_token
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Erreur lors de la synchronisation des favoris: {str(e)}"
+            }
+    
     async def is_favourite(self, user_id: str, musee_id: str) -> Dict[str, Any]:
         """Vérifier si un musée est dans les favoris d'un utilisateur"""
         try:
-            result = self.service_client.table('favourites').select('id').eq('user_id', user_id).eq('musee_id', musee_id).execute()
+            with timed("supabase_favourites_select"):
+                result = self.service_client.table('favourites').select('id').eq('user_id', user_id).eq('musee_id', musee_id).execute()
             
             return {
                 "success": True,
@@ -146,7 +301,8 @@ class SupabaseFavouritesService:
     async def get_favourites_count(self, user_id: str) -> Dict[str, Any]:
         """Récupérer le nombre de favoris d'un utilisateur"""
         try:
-            result = self.service_client.table('favourites').select('id', count='exact').eq('user_id', user_id).execute()
+            with timed("supabase_favourites_select"):
+                result = self.service_client.table('favourites').select('id', count='exact').eq('user_id', user_id).execute()
             
             return {
                 "success": True,
@@ -162,23 +318,24 @@ class SupabaseFavouritesService:
     async def search_favourites(self, user_id: str, search_term: str) -> Dict[str, Any]:
         """Rechercher dans les favoris d'un utilisateur"""
         try:
-            result = self.service_client.table('favourites').select(
-                """
-                id,
-                date_ajout,
-                musees (
-                    identifiant,
-                    nom_officiel,
-                    adresse,
-                    lieu,
-                    ville,
-                    region,
-                    departement,
-                    categorie,
-                    themes
-                )
-                """
-            ).eq('user_id', user_id).ilike('musees.nom_officiel', f'%{search_term}%').execute()
+            with timed("supabase_favourites_select"):
+                result = self.service_client.table('favourites').select(
+                    """
+                    id,
+                    date_ajout,
+                    musees (
+                        identifiant,
+                        nom_officiel,
+                        adresse,
+                        lieu,
+                        ville,
+                        region,
+                        departement,
+                        categorie,
+                        themes
+                    )
+                    """
+                ).eq('user_id', user_id).ilike('musees.nom_officiel', f'%{search_term}%').execute()
             
             return {
                 "success": True,